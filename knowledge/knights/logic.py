@@ -261,3 +261,44 @@ def model_check(knowledge, query):
 
     # Check that knowledge entails query
     return check_all(knowledge, query, symbols, dict())
+
+
+def to_mask_fn(sentence, symbols):
+    """Compiles sentence into a function of an integer model whose bit i is symbols[i]."""
+    index = {name: i for i, name in enumerate(symbols)}
+
+    def compile_expression(sentence):
+        """Returns a Python expression over `m` evaluating the sentence."""
+        if isinstance(sentence, Symbol):
+            return f"(m >> {index[sentence.name]} & 1)"
+        if isinstance(sentence, Not):
+            return f"(not {compile_expression(sentence.operand)})"
+        if isinstance(sentence, And):
+            if not sentence.conjuncts:
+                return "True"
+            return "(" + " and ".join(
+                compile_expression(conjunct) for conjunct in sentence.conjuncts
+            ) + ")"
+        if isinstance(sentence, Or):
+            if not sentence.disjuncts:
+                return "False"
+            return "(" + " or ".join(
+                compile_expression(disjunct) for disjunct in sentence.disjuncts
+            ) + ")"
+        if isinstance(sentence, Implication):
+            antecedent = compile_expression(sentence.antecedent)
+            consequent = compile_expression(sentence.consequent)
+            return f"(not {antecedent} or {consequent})"
+        if isinstance(sentence, Biconditional):
+            left = compile_expression(sentence.left)
+            right = compile_expression(sentence.right)
+            return f"(bool({left}) == bool({right}))"
+        raise TypeError("must be a logical sentence")
+
+    return eval(f"lambda m: bool({compile_expression(sentence)})")
+
+
+def truth_table_models(knowledge, symbols):
+    """Returns all integer models over symbols in which knowledge base is true."""
+    evaluate = to_mask_fn(knowledge, symbols)
+    return [model for model in range(1 << len(symbols)) if evaluate(model)]
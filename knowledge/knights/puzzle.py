@@ -73,8 +73,12 @@ def main():
         if len(knowledge.conjuncts) == 0:
             print("    Not yet implemented.")
         else:
+            # A symbol is entailed if it is true in every model of the knowledge
+            names = sorted(set.union(knowledge.symbols(), *(symbol.symbols() for symbol in symbols)))
+            models = truth_table_models(knowledge, names)
             for symbol in symbols:
-                if model_check(knowledge, symbol):
+                bit = 1 << names.index(symbol.name)
+                if all(model & bit for model in models):
                     print(f"    {symbol}")
 
 
@@ -1,5 +1,10 @@
+import heapq
+import itertools
 import random
 
+# Print the AI's inference steps while it plays
+DEBUG = False
+
 
 class Minesweeper():
     """
@@ -91,12 +96,16 @@ class Sentence():
     """
 
     def __init__(self, cells, count):
-        self.cells = set(cells)
+        self.cells = frozenset(cells)
         self.count = count
+        self._hash = hash((self.cells, self.count))
 
     def __eq__(self, other):
         return self.cells == other.cells and self.count == other.count
 
+    def __hash__(self):
+        return self._hash
+
     def __str__(self):
         return f"{self.cells} = {self.count}"
 
@@ -114,20 +123,23 @@ class Sentence():
 
     def mark_mine(self, cell):
         """
-        Updates internal knowledge representation given the fact that
-        a cell is known to be a mine.
+        Returns the sentence that results from knowing that
+        a cell is a mine. Sentences are hashed, so they are not
+        modified in place.
         """
         if cell in self.cells:
-            self.cells -= {cell}
-            self.count -= 1
+            return Sentence(self.cells - {cell}, self.count - 1)
+        return self
 
     def mark_safe(self, cell):
         """
-        Updates internal knowledge representation given the fact that
-        a cell is known to be safe.
+        Returns the sentence that results from knowing that
+        a cell is safe. Sentences are hashed, so they are not
+        modified in place.
         """
         if cell in self.cells:
-            self.cells -= {cell}
+            return Sentence(self.cells - {cell}, self.count)
+        return self
 
 
 class MinesweeperAI():
@@ -141,6 +153,16 @@ class MinesweeperAI():
         self.height = height
         self.width = width
 
+        # Neighbouring cells of every cell on the board
+        self._neighbors = {
+            (r, c): frozenset((i, j)
+                              for i in range(r - 1, r + 2)
+                              for j in range(c - 1, c + 2)
+                              if (i, j) != (r, c) and 0 <= i < height and 0 <= j < width)
+            for r in range(height)
+            for c in range(width)
+        }
+
         # Keep track of which cells have been clicked on
         self.moves_made = set()
 
@@ -148,8 +170,22 @@ class MinesweeperAI():
         self.mines = set()
         self.safes = set()
 
-        # List of sentences about the game known to be true
-        self.knowledge: list[Sentence] = []
+        # Set of sentences about the game known to be true
+        self.knowledge: set[Sentence] = set()
+
+        # Sentences containing each cell, and sentences changed since
+        # the last inference pass
+        self.cell_to_sentences: dict[tuple[int, int], set[Sentence]] = dict()
+        self.dirty: set[Sentence] = set()
+
+        # Dirty sentences as a heap of (size, sequence number, sentence),
+        # so the smallest is processed first; removed sentences are skipped
+        self.dirty_heap: list[tuple[int, int, Sentence]] = []
+        self.dirty_counter = itertools.count()
+
+        # Each sentence's cells as a bitmask with bit i * width + j set
+        # for cell (i, j)
+        self.cell_masks: dict[Sentence, int] = dict()
 
     def mark_mine(self, cell):
         """
@@ -157,8 +193,10 @@ class MinesweeperAI():
         to mark that cell as a mine as well.
         """
         self.mines.add(cell)
-        for sentence in self.knowledge:
-            sentence.mark_mine(cell)
+        for sentence in list(self.cell_to_sentences.get(cell, ())):
+            # Sentences are hashed by value, so replace rather than mutate
+            self.remove_sentence(sentence)
+            self.add_sentence(sentence.mark_mine(cell))
 
     def mark_safe(self, cell):
         """
@@ -166,8 +204,35 @@ class MinesweeperAI():
         to mark that cell as safe as well.
         """
         self.safes.add(cell)
-        for sentence in self.knowledge:
-            sentence.mark_safe(cell)
+        for sentence in list(self.cell_to_sentences.get(cell, ())):
+            # Sentences are hashed by value, so replace rather than mutate
+            self.remove_sentence(sentence)
+            self.add_sentence(sentence.mark_safe(cell))
+
+    def add_sentence(self, sentence):
+        """
+        Adds a non-empty sentence to the knowledge base and to the
+        watch list of each of its cells.
+        """
+        if len(sentence.cells) == 0 or sentence in self.knowledge:
+            return
+        self.knowledge.add(sentence)
+        self.dirty.add(sentence)
+        heapq.heappush(self.dirty_heap, (len(sentence.cells), next(self.dirty_counter), sentence))
+        self.cell_masks[sentence] = sum(1 << (i * self.width + j) for i, j in sentence.cells)
+        for cell in sentence.cells:
+            self.cell_to_sentences.setdefault(cell, set()).add(sentence)
+
+    def remove_sentence(self, sentence):
+        """
+        Removes a sentence from the knowledge base and from the
+        watch list of each of its cells.
+        """
+        self.knowledge.discard(sentence)
+        self.dirty.discard(sentence)
+        del self.cell_masks[sentence]
+        for cell in sentence.cells:
+            self.cell_to_sentences[cell].discard(sentence)
 
     def add_knowledge(self, cell, count):
         """
@@ -187,16 +252,16 @@ class MinesweeperAI():
         self.moves_made.add(cell)
         self.mark_safe(cell)
 
-        a_nearby_cells = self.nearby_cells(cell)
+        a_nearby_cells = self._neighbors[cell]
         if count == 0:
             for cell in a_nearby_cells:
                 self.mark_safe(cell)
 
         if count > 0:
-            sentence = Sentence(a_nearby_cells, count)
-            if sentence in self.knowledge:
-                return
-            self.knowledge.append(sentence)
+            # Leave out cells whose state is already known
+            sentence = Sentence(a_nearby_cells - self.safes - self.mines,
+                                count - len(a_nearby_cells & self.mines))
+            self.add_sentence(sentence)
 
         self.update_knowledge_base()
 
@@ -206,8 +271,9 @@ class MinesweeperAI():
 
         while ((len(new_safes) > 0 or len(new_mines) > 0)
                and loop_counter < 150):
-            print(f"new_safes: {new_safes}")
-            print(f"new_mines: {new_mines}")
+            if DEBUG:
+                print(f"new_safes: {new_safes}")
+                print(f"new_mines: {new_mines}")
 
             loop_counter += 1
             if len(new_safes) > 0:
@@ -223,11 +289,15 @@ class MinesweeperAI():
             new_safes = self.find_new_safes()
             new_mines = self.find_new_mines()
 
-        print(f"breaker: {loop_counter}")
-        for i, sentence in enumerate(self.knowledge):
-            print(f"knowledge {i}: {self.knowledge[i]}")
-        print(f"all safe moves: {self.safes}")
-        print(f"all mines: {self.mines}")
+        # Every changed sentence must have been through inference
+        assert len(self.dirty) == 0
+
+        if DEBUG:
+            print(f"breaker: {loop_counter}")
+            for i, sentence in enumerate(self.knowledge):
+                print(f"knowledge {i}: {sentence}")
+            print(f"all safe moves: {self.safes}")
+            print(f"all mines: {self.mines}")
 
     def find_new_safes(self):
         new_safes = set()
@@ -246,63 +316,51 @@ class MinesweeperAI():
         new_mines -= self.mines
         return new_mines
 
-    def nearby_cells(self, cell):
-        return {(i, j)
-                for i in range(cell[0] - 1, cell[0] + 2)
-                for j in range(cell[1] - 1, cell[1] + 2)
-                if (i, j) != cell and 0 <= i < self.width and 0 <= j < self.height}
-
-    def new_sentence_from_safes(self, current_sentence):
-        delta = current_sentence.cells - self.safes
-        if delta < current_sentence.cells and len(delta) > 0:
-            sentence = Sentence(delta, current_sentence.count)
-            if sentence not in self.knowledge and len(sentence.cells) > 0:
-                return sentence
-        return None
-
     def update_knowledge_base(self):
-        print(f"update_knowledge_base started")
-        self.knowledge = [snt for snt in self.knowledge if len(snt.cells) > 0]
-
-        no_doubles = []
-
-        for snt in self.knowledge:
-            if snt not in no_doubles:
-                no_doubles.append(snt)
-        self.knowledge = no_doubles
-
-        for_adding = []
-        for i in range(len(self.knowledge) - 1):
-            for j in range(i + 1, len(self.knowledge)):
-                sentence1 = self.knowledge[i]
-                sentence2 = self.knowledge[j]
-                for sentence in (self.new_sentence_from_safes(sentence1), self.new_sentence_from_safes(sentence2)):
-                    if sentence is not None and sentence not in for_adding:
-                        for_adding.append(sentence)
-
-                new_sentence = None
-
-                if sentence1.cells.issubset(sentence2.cells):
-                    new_sentence = Sentence(sentence2.cells - sentence1.cells,
-                                            sentence2.count - sentence1.count)
-                elif sentence2.cells.issubset(sentence1.cells):
-                    new_sentence = Sentence(sentence1.cells - sentence2.cells,
-                                            sentence1.count - sentence2.count)
-
-                if (new_sentence is not None
-                        and new_sentence not in self.knowledge
-                        and new_sentence not in for_adding
-                        and len(new_sentence.cells) > 0):
-                    for_adding.append(new_sentence)
-
-        for item in for_adding:
-            print(f"for adding: {item}")
-
-        if len(for_adding) > 0:
-            for sentence in for_adding:
-                self.knowledge.append(sentence)
-            print("knowledge recursive update is needed")
-            self.update_knowledge_base()
+        """
+        Infers new sentences with the subset rule until nothing changes.
+        Each changed sentence, smallest first, is only compared with the
+        sentences on its watch lists, using cell bitmasks to test containment.
+        """
+        if DEBUG:
+            print("update_knowledge_base started")
+        while len(self.dirty_heap) > 0:
+            _, _, sentence = heapq.heappop(self.dirty_heap)
+            if sentence not in self.dirty:
+                continue
+            self.dirty.remove(sentence)
+
+            size = len(sentence.cells)
+            mask = self.cell_masks[sentence]
+
+            # Supersets contain every cell of the sentence, so they all
+            # appear on the shortest of its watch lists
+            watch_list = min((self.cell_to_sentences[cell] for cell in sentence.cells), key=len)
+            for other in list(watch_list):
+                if (len(other.cells) > size and other.count >= sentence.count
+                        and self.cell_masks[other] & mask == mask):
+                    self.infer_from_subset(sentence, other)
+
+            # Subsets are strictly smaller sentences sharing a cell with it
+            neighbours = set()
+            for cell in sentence.cells:
+                neighbours |= self.cell_to_sentences[cell]
+            for other in neighbours:
+                if len(other.cells) < size and other.count <= sentence.count:
+                    other_mask = self.cell_masks[other]
+                    if other_mask & mask == other_mask:
+                        self.infer_from_subset(other, sentence)
+
+    def infer_from_subset(self, subset, superset):
+        """
+        Adds the sentence implied by `subset` being contained in `superset`.
+        """
+        new_sentence = Sentence(superset.cells - subset.cells,
+                                superset.count - subset.count)
+        if new_sentence not in self.knowledge:
+            if DEBUG:
+                print(f"for adding: {new_sentence}")
+            self.add_sentence(new_sentence)
 
     def make_safe_move(self):
         """
@@ -326,8 +384,16 @@ class MinesweeperAI():
             1) have not already been chosen, and
             2) are not known to be mines
         """
-        available_moves = {(i, j) for i in range(self.width)
-                           for j in range(self.height)} - self.moves_made - self.mines
-        if len(available_moves) > 0:
-            return random.choice(list(available_moves))
-        return None
+        forbidden = self.moves_made | self.mines
+        if len(forbidden) >= self.height * self.width:
+            return None
+
+        # Most of the board is usually still open, so sample directly
+        for _ in range(20):
+            cell = (random.randrange(self.height), random.randrange(self.width))
+            if cell not in forbidden:
+                return cell
+
+        available_moves = [(i, j) for i in range(self.height)
+                           for j in range(self.width) if (i, j) not in forbidden]
+        return random.choice(available_moves)
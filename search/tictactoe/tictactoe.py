@@ -6,6 +6,15 @@ X = "X"
 O = "O"
 EMPTY = None
 
+# Boards are also encoded as two 9-bit masks, one per player, where
+# bit 3 * i + j is set if that player has taken cell (i, j)
+_FULL_MASK = 0b111111111
+_WIN_MASKS = (
+    0b000000111, 0b000111000, 0b111000000,  # rows
+    0b001001001, 0b010010010, 0b100100100,  # columns
+    0b100010001, 0b001010100                # diagonals
+)
+
 
 def initial_state():
     """
@@ -53,7 +62,7 @@ def result(board, action):
     """
     available_actions = actions(board)
 
-    copy_board = [row[:] for row in board]
+    copy_board = [list(row) for row in board]
 
     if action not in available_actions:
         raise InvalidActionError(action, board, "Action is not available")
@@ -94,82 +103,124 @@ def terminal(board):
     """
     Returns True if game is over, False otherwise.
     """
-    return len(actions(board)) == 0 or winner(board) is not None
+    return _outcome(board)[0]
 
 
 def utility(board):
     """
     Returns 1 if X has won the game, -1 if O has won, 0 otherwise.
     """
-    if winner(board) == X:
-        return 1
-    if winner(board) == O:
-        return -1
-    return 0
+    return _outcome(board)[1]
+
+
+def _outcome(board):
+    """
+    Returns (done, utility) for the board, checking the lines only once.
+    """
+    won_by = winner(board)
+    if won_by == X:
+        return True, 1
+    if won_by == O:
+        return True, -1
+    return all(cell is not EMPTY for row in board for cell in row), 0
 
 
 def minimax(board):
     """
     Returns the optimal action for the current player on the board.
     """
-    if terminal(board):
+    x_mask, o_mask = _to_masks(board)
+    if _winner(x_mask, o_mask) is not None or (x_mask | o_mask) == _FULL_MASK:
         return None
 
-    plr = player(board)
-    print(f"player: {plr}")
-    available_actions = actions(board)
-
-    candidates = []
+    move = _BEST_MOVE[(x_mask, o_mask)]
+    return divmod(move.bit_length() - 1, 3)
 
-    if plr == X:
-        for action in available_actions:
-            candidates.append((action, min_function(result(board, action))))
 
-        print(f"candidates: {candidates}")
-        best_candidate = candidates[0]
-
-        for candidate in candidates:
-            if candidate[1] > best_candidate[1]:
-                best_candidate = candidate
+def _to_masks(board):
+    """
+    Returns the (x_mask, o_mask) encoding of the board.
+    """
+    x_mask = 0
+    o_mask = 0
+    for i, row in enumerate(board):
+        for j, cell in enumerate(row):
+            if cell == X:
+                x_mask |= 1 << (3 * i + j)
+            elif cell == O:
+                o_mask |= 1 << (3 * i + j)
+    return x_mask, o_mask
 
-        print(f"best_candidate: {best_candidate}")
-        return best_candidate[0]
 
-    for action in available_actions:
-        candidates.append((action, max_function(result(board, action))))
+def _winner(x_mask, o_mask):
+    """
+    Returns the winner of the game encoded by the masks, if there is one.
+    """
+    if any((x_mask & mask) == mask for mask in _WIN_MASKS):
+        return X
+    if any((o_mask & mask) == mask for mask in _WIN_MASKS):
+        return O
+    return None
 
-    print(f"candidates: {candidates}")
-    best_candidate = candidates[0]
 
-    for candidate in candidates:
-        if candidate[1] < best_candidate[1]:
-            best_candidate = candidate
+def _player(x_mask, o_mask):
+    """
+    Returns player who has the next turn on the board encoded by the masks.
+    """
+    return X if bin(x_mask).count("1") == bin(o_mask).count("1") else O
 
-    print(f"best_candidate: {best_candidate}")
-    return best_candidate[0]
 
+def _actions(x_mask, o_mask):
+    """
+    Yields the bit of every free cell on the board encoded by the masks.
+    """
+    free = ~(x_mask | o_mask) & _FULL_MASK
+    while free:
+        lsb = free & -free
+        yield lsb
+        free ^= lsb
 
-def min_function(board) -> int:
-    if terminal(board):
-        return utility(board)
-    v = float("inf")
 
-    for action in actions(board):
-        v = min(v, max_function(result(board, action)))
+def _best_moves():
+    """
+    Returns a dict mapping every reachable non-terminal (x_mask, o_mask)
+    to the optimal move for the player to move, as a single-bit mask.
+    """
+    values = dict()
+    best_move = dict()
 
-    return v
+    def negamax(x_mask, o_mask):
+        # Value of the board for the player who has the next turn
+        key = (x_mask, o_mask)
+        if key in values:
+            return values[key]
 
+        if _winner(x_mask, o_mask) is not None:
+            value = -1
+        elif (x_mask | o_mask) == _FULL_MASK:
+            value = 0
+        else:
+            value = -2
+            turn = _player(x_mask, o_mask)
+            for move in _actions(x_mask, o_mask):
+                if turn == X:
+                    child_value = -negamax(x_mask | move, o_mask)
+                else:
+                    child_value = -negamax(x_mask, o_mask | move)
+                if child_value > value:
+                    value = child_value
+                    best_move[key] = move
 
-def max_function(board) -> int:
-    if terminal(board):
-        return utility(board)
-    v = float("-inf")
+        values[key] = value
+        return value
 
-    for action in actions(board):
-        v = max(v, min_function(result(board, action)))
-    return v
+    negamax(0, 0)
+    return best_move
 
 
 class InvalidActionError(Exception):
     def __init__(self, action, board, message):
-        print('InvalidActionError: ', message, 'Action: ', action, 'on board: ', board)
\ No newline at end of file
+        print('InvalidActionError: ', message, 'Action: ', action, 'on board: ', board)
+
+
+_BEST_MOVE = _best_moves()
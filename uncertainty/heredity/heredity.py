@@ -1,7 +1,9 @@
 import csv
-import itertools
+import functools
 import sys
 
+import numpy as np
+
 PROBS = {
 
     # Unconditional probabilities for having gene
@@ -36,6 +38,25 @@ PROBS = {
     "mutation": 0.01
 }
 
+# Lookup tables indexed by gene count (and trait as 0/1), used by the
+# vectorized joint probability computation
+GENE_TABLE = np.array([PROBS["gene"][genes] for genes in range(3)])
+TRAIT_TABLE = np.array([
+    [PROBS["trait"][genes][False], PROBS["trait"][genes][True]]
+    for genes in range(3)
+])
+
+# Probability of passing the gene on for a parent with 0, 1 or 2 copies
+_PASSING = np.abs(np.arange(3) * 0.5 - PROBS["mutation"])
+
+# Probability of a child's gene count given the parents' gene counts,
+# indexed as INHERITANCE_TABLE[mother_genes, father_genes, child_genes]
+INHERITANCE_TABLE = np.stack([
+    np.outer(1 - _PASSING, 1 - _PASSING),
+    np.outer(_PASSING, 1 - _PASSING) + np.outer(1 - _PASSING, _PASSING),
+    np.outer(_PASSING, _PASSING)
+], axis=-1)
+
 
 def main():
     # Check for proper usage
@@ -43,44 +64,8 @@ def main():
         sys.exit("Usage: python heredity.py data.csv")
     people = load_data(sys.argv[1])
 
-    # Keep track of gene and trait probabilities for each person
-    probabilities = {
-        person: {
-            "gene": {
-                2: 0,
-                1: 0,
-                0: 0
-            },
-            "trait": {
-                True: 0,
-                False: 0
-            }
-        }
-        for person in people
-    }
-
-    # Loop over all sets of people who might have the trait
-    names = set(people)
-    for have_trait in powerset(names):
-
-        # Check if current set of people violates known information
-        fails_evidence = any(
-            (people[person]["trait"] is not None and
-             people[person]["trait"] != (person in have_trait))
-            for person in names
-        )
-        if fails_evidence:
-            continue
-
-        # Loop over all sets of people who might have the gene
-        for one_gene in powerset(names):
-            for two_genes in powerset(names - one_gene):
-                # Update probabilities with new joint probability
-                p = joint_probability(people, one_gene, two_genes, have_trait)
-                update(probabilities, one_gene, two_genes, have_trait, p)
-
-    # Ensure probabilities sum to 1
-    normalize(probabilities)
+    # Compute exact distributions for everyone by variable elimination
+    probabilities = eliminate(people)
 
     # Print results
     for person in people:
@@ -114,16 +99,275 @@ def load_data(filename):
     return data
 
 
-def powerset(s):
+def topological_order(people):
+    """
+    Return a list of names ordered so that parents come before children.
+    """
+    order = []
+    visited = set()
+
+    def visit(name):
+        if name in visited:
+            return
+        visited.add(name)
+        for parent in (people[name]["mother"], people[name]["father"]):
+            if parent is not None:
+                visit(parent)
+        order.append(name)
+
+    for name in people:
+        visit(name)
+    return order
+
+
+def sum_out(factors, variable):
     """
-    Return a list of all possible subsets of set s.
+    Eliminate `variable` from a list of (variables, table) factors by
+    multiplying together the factors that mention it and summing it out.
     """
-    s = list(s)
-    return [
-        set(s) for s in itertools.chain.from_iterable(
-            itertools.combinations(s, r) for r in range(len(s) + 1)
-        )
-    ]
+    related = [factor for factor in factors if variable in factor[0]]
+    rest = [factor for factor in factors if variable not in factor[0]]
+
+    variables = sorted(set().union(*(factor[0] for factor in related)) - {variable})
+
+    # Relabel variables to small integers for np.einsum subscripts
+    labels = {v: i for i, v in enumerate(variables + [variable])}
+    operands = []
+    for factor_variables, table in related:
+        operands += [table, [labels[v] for v in factor_variables]]
+    table = np.einsum(*operands, [labels[v] for v in variables])
+
+    return rest + [(tuple(variables), table)]
+
+
+def eliminate(people):
+    """
+    Compute the gene and trait distribution of every person, conditioned
+    on the known traits, by variable elimination over the Bayesian network
+    of gene counts.
+
+    Gives the same (normalized) result as enumerating every assignment
+    with `joint_probability`, but without the exponential blow-up.
+    """
+    names = topological_order(people)
+    index = {name: i for i, name in enumerate(names)}
+
+    # One gene factor per person, plus an evidence factor for known traits
+    factors = []
+    for name in names:
+        person = people[name]
+        if person["mother"] is None:
+            factors.append(((index[name],), GENE_TABLE))
+        else:
+            factors.append(((index[person["mother"]], index[person["father"]], index[name]),
+                            INHERITANCE_TABLE))
+        if person["trait"] is not None:
+            factors.append(((index[name],), TRAIT_TABLE[:, int(person["trait"])]))
+
+    probabilities = dict()
+    for name in people:
+        # Eliminate everyone else, children before parents
+        remaining = factors
+        for other in reversed(names):
+            if other != name:
+                remaining = sum_out(remaining, index[other])
+
+        gene = np.ones(3)
+        for _, table in remaining:
+            gene = gene * table
+        gene = gene / gene.sum()
+
+        trait = people[name]["trait"]
+        p_trait = float(trait) if trait is not None else TRAIT_TABLE[:, 1] @ gene
+
+        probabilities[name] = {
+            "gene": {
+                2: gene[2],
+                1: gene[1],
+                0: gene[0]
+            },
+            "trait": {
+                True: p_trait,
+                False: 1 - p_trait
+            }
+        }
+    return probabilities
+
+
+def enumerate_probabilities(people):
+    """
+    Compute the same distributions as `eliminate` by brute force, summing
+    joint probabilities over every assignment consistent with evidence.
+    Kept as a reference implementation for checking `eliminate`; `main`
+    does not call it.
+    """
+    # Keep track of gene and trait probabilities for each person
+    probabilities = {
+        person: {
+            "gene": {
+                2: 0,
+                1: 0,
+                0: 0
+            },
+            "trait": {
+                True: 0,
+                False: 0
+            }
+        }
+        for person in people
+    }
+
+    # Compute joint probabilities of all assignments consistent with evidence
+    names = list(people)
+    mother_idx, father_idx = parent_indices(people, names)
+    one_gene_mask, two_genes_mask, have_trait_mask = assignment_masks(people, names)
+    gene_counts = (unpack_mask(one_gene_mask, len(names)) +
+                   2 * unpack_mask(two_genes_mask, len(names)))
+    trait_arr = unpack_mask(have_trait_mask, len(names)).astype(bool)
+    joint_kernel = compiled_joint_kernel()
+    if joint_kernel is not None:
+        p = joint_kernel(gene_counts, trait_arr.astype(np.int8), mother_idx, father_idx,
+                         mother_idx < 0, GENE_TABLE, INHERITANCE_TABLE, TRAIT_TABLE)
+    else:
+        p = joint_probabilities(gene_counts, trait_arr, mother_idx, father_idx)
+
+    # Accumulate joint probabilities into each person's distributions
+    person_idx = np.broadcast_to(np.arange(len(names)), gene_counts.shape)
+    gene_totals = np.zeros((len(names), 3))
+    trait_totals = np.zeros((len(names), 2))
+    np.add.at(gene_totals, (person_idx, gene_counts), p[:, None])
+    np.add.at(trait_totals, (person_idx, trait_arr.astype(np.int8)), p[:, None])
+    for i, person in enumerate(names):
+        for genes in range(3):
+            probabilities[person]["gene"][genes] = gene_totals[i, genes]
+        probabilities[person]["trait"][True] = trait_totals[i, 1]
+        probabilities[person]["trait"][False] = trait_totals[i, 0]
+
+    # Ensure probabilities sum to 1
+    normalize(probabilities)
+    return probabilities
+
+
+def parent_indices(people, names):
+    """
+    Return arrays with the index in `names` of each person's mother and
+    father, or -1 for people whose parents are unknown.
+    """
+    index = {name: i for i, name in enumerate(names)}
+    mother_idx = np.array([index.get(people[name]["mother"], -1) for name in names])
+    father_idx = np.array([index.get(people[name]["father"], -1) for name in names])
+    return mother_idx, father_idx
+
+
+def to_mask(subset, names):
+    """
+    Return the set of people `subset` packed into an integer bitmask,
+    where bit i is set if `names[i]` is in the subset.
+    """
+    return sum(1 << i for i, name in enumerate(names) if name in subset)
+
+
+def submasks(mask):
+    """
+    Yield every submask of the integer bitmask `mask`, including 0.
+    """
+    submask = mask
+    while True:
+        yield submask
+        if submask == 0:
+            return
+        submask = (submask - 1) & mask
+
+
+def unpack_mask(masks, n):
+    """
+    Return an (M, n) int8 array of the bits of each of the M `masks`.
+    """
+    return ((masks[:, None] >> np.arange(n, dtype=np.uint64)) & 1).astype(np.int8)
+
+
+def assignment_masks(people, names):
+    """
+    Return arrays of bit-packed `one_gene`, `two_genes` and `have_trait`
+    masks, one entry per assignment consistent with known trait evidence.
+    Only used by the reference enumeration in `enumerate_probabilities`.
+    """
+    everyone_mask = (1 << len(names)) - 1
+    gene_masks = np.array([
+        (one_gene_mask, two_genes_mask)
+        for one_gene_mask in range(1 << len(names))
+        for two_genes_mask in submasks(everyone_mask & ~one_gene_mask)
+    ], dtype=np.uint64)
+
+    # Known traits are fixed, so only enumerate subsets of unknown people
+    known_true_mask = to_mask({name for name in names if people[name]["trait"]}, names)
+    unknown_mask = to_mask({name for name in names if people[name]["trait"] is None}, names)
+    trait_masks = np.array([
+        known_true_mask | have_trait_mask
+        for have_trait_mask in submasks(unknown_mask)
+    ], dtype=np.uint64)
+
+    one_gene_mask = np.tile(gene_masks[:, 0], len(trait_masks))
+    two_genes_mask = np.tile(gene_masks[:, 1], len(trait_masks))
+    have_trait_mask = np.repeat(trait_masks, len(gene_masks))
+    return one_gene_mask, two_genes_mask, have_trait_mask
+
+
+def joint_probabilities(gene_counts, trait_arr, mother_idx, father_idx):
+    """
+    Compute joint probabilities for a batch of M assignments at once.
+
+    `gene_counts` is an (M, N) array with the number of gene copies of
+    each person and `trait_arr` an (M, N) bool array of who has the trait.
+    Equivalent to calling `joint_probability` on every assignment.
+    """
+    has_parents = mother_idx >= 0
+
+    # Probability of each parent passing the gene, including mutation
+    p_from_mother = np.abs(gene_counts[:, mother_idx] * 0.5 - PROBS["mutation"])
+    p_from_father = np.abs(gene_counts[:, father_idx] * 0.5 - PROBS["mutation"])
+    inherited = np.where(
+        gene_counts == 0, (1 - p_from_mother) * (1 - p_from_father),
+        np.where(gene_counts == 1,
+                 p_from_mother * (1 - p_from_father) + p_from_father * (1 - p_from_mother),
+                 p_from_mother * p_from_father))
+
+    p_genes = np.where(has_parents, inherited, GENE_TABLE[gene_counts])
+    return np.prod(p_genes * TRAIT_TABLE[gene_counts, trait_arr.astype(np.int8)], axis=1)
+
+
+@functools.lru_cache(maxsize=None)
+def compiled_joint_kernel():
+    """
+    Return a numba-compiled kernel computing the same batch of joint
+    probabilities as `joint_probabilities`, or None if numba is not
+    installed. numba is only imported on first use, as it is slow to load.
+    """
+    try:
+        import numba
+    except ImportError:
+        return None
+
+    @numba.njit(parallel=True, fastmath=True)
+    def joint_kernel(gene_counts, trait_bits, mother_idx, father_idx, is_root,
+                     gene_prior, inheritance_table, trait_table):
+        m, n = gene_counts.shape
+        result = np.empty(m)
+        for a in numba.prange(m):
+            p = 1.0
+            for person in range(n):
+                genes = gene_counts[a, person]
+                if is_root[person]:
+                    p *= gene_prior[genes]
+                else:
+                    p *= inheritance_table[gene_counts[a, mother_idx[person]],
+                                           gene_counts[a, father_idx[person]],
+                                           genes]
+                p *= trait_table[genes, trait_bits[a, person]]
+            result[a] = p
+        return result
+
+    return joint_kernel
 
 
 def joint_probability(people, one_gene, two_genes, have_trait):
@@ -156,7 +400,7 @@ def joint_probability(people, one_gene, two_genes, have_trait):
             if genes_count == 0:
                 current_genes_count_probability = p_no_genes_from_mother * p_no_genes_from_father
             elif genes_count == 1:
-                current_genes_count_probability = (p_genes_from_mother * p_no_genes_from_mother +
+                current_genes_count_probability = (p_genes_from_mother * p_no_genes_from_father +
                                                    p_genes_from_father * p_no_genes_from_mother)
             else:
                 current_genes_count_probability = p_genes_from_mother * p_genes_from_father
@@ -167,28 +411,6 @@ def joint_probability(people, one_gene, two_genes, have_trait):
     return p
 
 
-def update(probabilities, one_gene, two_genes, have_trait, p):
-    """
-    Add to `probabilities` a new joint probability `p`.
-    Each person should have their "gene" and "trait" distributions updated.
-    Which value for each distribution is updated depends on whether
-    the person is in `have_gene` and `have_trait`, respectively.
-    """
-    for person in probabilities:
-        data = probabilities[person]
-        if person in have_trait:
-            data["trait"][True] += p
-        else:
-            data["trait"][False] += p
-
-        if person in one_gene:
-            data["gene"][1] += p
-        elif person in two_genes:
-            data["gene"][2] += p
-        else:
-            data["gene"][0] += p
-
-
 def normalize(probabilities):
     """
     Update `probabilities` such that each probability distribution
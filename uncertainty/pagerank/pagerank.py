@@ -1,26 +1,38 @@
+import html
 import os
 import random
 import re
 import sys
 
-from icdiff import start
+import numpy as np
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
 
 DAMPING = 0.85
 SAMPLES = 10000
 
+# Matches the target of every <a ... href=...> tag in a page, whether the
+# value is double-quoted, single-quoted or unquoted
+LINK_RE = re.compile(
+    rb"<a\s[^>]*?\bhref\s*=\s*(?:\"([^\"]*)\"|'([^']*)'|([^\s\"'>]+))",
+    re.IGNORECASE
+)
+
 
 def main():
     if len(sys.argv) != 2:
         sys.exit("Usage: python pagerank.py corpus")
     corpus = crawl(sys.argv[1])
     ranks = sample_pagerank(corpus, DAMPING, SAMPLES)
-    print(f"PageRank Results from Sampling (n = {SAMPLES})")
-    for page in sorted(ranks):
-        print(f"  {page}: {ranks[page]:.4f}")
+    lines = [f"PageRank Results from Sampling (n = {SAMPLES})"]
+    lines += [f"  {page}: {ranks[page]:.4f}" for page in sorted(ranks)]
     ranks = iterate_pagerank(corpus, DAMPING)
-    print(f"PageRank Results from Iteration")
-    for page in sorted(ranks):
-        print(f"  {page}: {ranks[page]:.4f}")
+    lines.append("PageRank Results from Iteration")
+    lines += [f"  {page}: {ranks[page]:.4f}" for page in sorted(ranks)]
+    print("\n".join(lines))
 
 
 def crawl(directory):
@@ -35,10 +47,9 @@ def crawl(directory):
     for filename in os.listdir(directory):
         if not filename.endswith(".html"):
             continue
-        with open(os.path.join(directory, filename)) as f:
+        with open(os.path.join(directory, filename), "rb") as f:
             contents = f.read()
-            links = re.findall(r"<a\s+(?:[^>]*?)href=\"([^\"]*)\"", contents)
-            pages[filename] = set(links) - {filename}
+            pages[filename] = find_links(contents) - {filename}
 
     # Only include links to other pages in the corpus
     for filename in pages:
@@ -50,6 +61,24 @@ def crawl(directory):
     return pages
 
 
+def find_links(contents):
+    """
+    Return the set of link targets in the raw bytes of an HTML page,
+    parsing it with lxml when available and a regex otherwise.
+    """
+    if lxml is not None:
+        try:
+            return set(lxml.html.fromstring(contents).xpath("//a/@href"))
+        except lxml.etree.ParserError:
+            # lxml rejects pages with no elements, e.g. only a comment,
+            # and such a page has no links
+            return set()
+    return {
+        html.unescape(b"".join(groups).decode("utf-8", errors="replace"))
+        for groups in LINK_RE.findall(contents)
+    }
+
+
 def transition_model(corpus, page, damping_factor):
     """
     Return a probability distribution over which page to visit next,
@@ -59,18 +88,21 @@ def transition_model(corpus, page, damping_factor):
     linked to by `page`. With probability `1 - damping_factor`, choose
     a link at random chosen from all pages in the corpus.
     """
-    page_ranks_result = init_pages_dict_with_corpus(corpus)
+    pages = tuple(init_pages_dict_with_corpus(corpus).keys())
 
-    all_pages_p = (1 - damping_factor) / len(page_ranks_result)
-    current_page_neighbours_p = len(corpus[page]) / damping_factor + all_pages_p
+    all_pages_p = (1 - damping_factor) / len(pages)
+    page_ranks_result = {a_page: all_pages_p for a_page in pages}
 
-    for a_page in page_ranks_result:
-        if a_page in corpus[page]:
-            page_ranks_result[a_page] = current_page_neighbours_p
-        else:
-            page_ranks_result[a_page] = all_pages_p
+    # A page with no links is treated as linking to every page
+    if len(corpus[page]) > 0:
+        share = damping_factor / len(corpus[page])
+        for a_page in corpus[page]:
+            page_ranks_result[a_page] += share
+    else:
+        share = damping_factor / len(pages)
+        for a_page in pages:
+            page_ranks_result[a_page] += share
 
-    print(page_ranks_result)
     return page_ranks_result
 
 
@@ -83,20 +115,31 @@ def sample_pagerank(corpus, damping_factor, n):
     their estimated PageRank value (a value between 0 and 1). All
     PageRank values should sum to 1.
     """
-    page_ranks_result = init_pages_dict_with_corpus(corpus)
-    pages: list[str] = [key for key in page_ranks_result.keys()]
-    start_page = random.choice(pages)
-    transition = transition_model(corpus, start_page, damping_factor)
-
-    for i in range(n):
-        next_page = random_page_by_weights(transition)
-        page_ranks_result[next_page] += 1
-        transition = transition_model(corpus, next_page, damping_factor)
-
-    for _, page in enumerate(pages):
-        page_ranks_result[page] = page_ranks_result[page] / n
+    pages: list[str] = list(init_pages_dict_with_corpus(corpus).keys())
+    index = {page: i for i, page in enumerate(pages)}
+    links = [tuple(index[link] for link in corpus[page]) for page in pages]
+
+    # Draw all random numbers up front, seeded from `random` so that
+    # seeding it keeps results reproducible
+    rng = np.random.default_rng(random.getrandbits(64))
+    teleports = (rng.random(n) < 1 - damping_factor).tolist()
+    random_pages = rng.integers(0, len(pages), n).tolist()
+    link_choices = rng.random(n).tolist()
+
+    # The surfer starts on a random page, then either teleports to a random
+    # page or follows a random link; pages without links always teleport
+    counts = np.zeros(len(pages), dtype=np.int64)
+    current = random_pages[0]
+    counts[current] += 1
+    for i in range(1, n):
+        page_links = links[current]
+        if teleports[i] or len(page_links) == 0:
+            current = random_pages[i]
+        else:
+            current = page_links[int(link_choices[i] * len(page_links))]
+        counts[current] += 1
 
-    return page_ranks_result
+    return {page: float(counts[i] / n) for i, page in enumerate(pages)}
 
 
 def iterate_pagerank(corpus, damping_factor):
@@ -108,55 +151,42 @@ def iterate_pagerank(corpus, damping_factor):
     their estimated PageRank value (a value between 0 and 1). All
     PageRank values should sum to 1.
     """
-    page_ranks_result = init_pages_dict_with_corpus(corpus)
-    default_value = 1 / len(page_ranks_result.keys())
-    page_ranks_result = init_pages_dict_with_corpus(corpus, default_value)
+    pages: list[str] = list(init_pages_dict_with_corpus(corpus).keys())
+    links = link_matrix(corpus, pages)
 
-    pages: list[str] = [key for key in page_ranks_result.keys()]
-
-    page_ranks_result_new = calc_new_ranks(pages, damping_factor, page_ranks_result, corpus)
+    ranks = np.full(len(pages), 1 / len(pages))
 
     iterations_count_limit = 50000
-    iterations_count = 0
-
-    while (not is_deltas_match_precision(page_ranks_result, page_ranks_result_new, 0.001)
-           and iterations_count < iterations_count_limit):
-        iterations_count += 1
-        page_ranks_result = page_ranks_result_new
-        page_ranks_result_new = calc_new_ranks(pages, damping_factor, page_ranks_result, corpus)
-    return page_ranks_result_new
-
-
-def is_deltas_match_precision(first_page_ranks_result: dict[str, float],
-                              second_page_ranks_result: dict[str, float],
-                              precision: float):
-    for page in first_page_ranks_result.keys():
-        if abs(first_page_ranks_result[page] - second_page_ranks_result[page]) > precision:
-            return False
-
-    return True
+    for _ in range(iterations_count_limit):
+        new_ranks = (1 - damping_factor) / len(pages) + damping_factor * (links @ ranks)
+        converged = np.max(np.abs(new_ranks - ranks)) < 0.001
+        ranks = new_ranks
+        if converged:
+            break
 
+    return {page: float(ranks[i]) for i, page in enumerate(pages)}
 
-def calc_new_ranks(pages: list[str], damping_factor: float,
-                   current_page_ranks_result: dict[str, float], corpus: dict[str, set[str]]):
-    page_ranks_result_new = dict()
-    for page in pages:
-        p1 = (1 - damping_factor) / len(pages)
-        p2 = sum([current_page_ranks_result[pge] / len(corpus[pge])
-                  for pge in pages if pge != page and page in corpus[pge]])
-        page_ranks_result_new[page] = p1 + damping_factor * p2
 
-    return page_ranks_result_new
+def link_matrix(corpus: dict[str, set[str]], pages: list[str]) -> np.ndarray:
+    """
+    Return a (P, P) array whose entry [j, i] is the probability of
+    following a link from `pages[i]` to `pages[j]`. A page with no
+    links is treated as linking to every page, itself included.
+    """
+    index = {page: i for i, page in enumerate(pages)}
+    links = np.zeros((len(pages), len(pages)))
+    for i, page in enumerate(pages):
+        if len(corpus[page]) > 0:
+            for link in corpus[page]:
+                links[index[link], i] = 1 / len(corpus[page])
+        else:
+            links[:, i] = 1 / len(pages)
+    return links
 
 
 def init_pages_dict_with_corpus(corpus: dict[str, set[str]], default_value: float = 0.0) -> dict[str, float]:
     return {key: default_value for key in (set(corpus.keys()) | {page for pages in corpus.values() for page in pages})}
 
 
-def random_page_by_weights(transition: dict[str, float]) -> str:
-    return random.choices(
-        population=[page for page in transition.keys()], weights=[weight for weight in transition.values()], k=1)[0]
-
-
 if __name__ == "__main__":
     main()